@@ -1,11 +1,14 @@
+import threading
 from abc import ABC, abstractmethod
 from datetime import datetime
 from types import ModuleType
+import numpy as np
 from dataclasses import dataclass
 from importlib import import_module
 from tzlocal import get_localzone_name
 from .constant import Interval, Exchange, Dividend, ExtraInterval
 from .object import BarData, TickData, DividendData, TradeDateData, MainContractData, HistoryRequest
+from ._dividend_tool import make_front_back_dr, make_timetags_back_dr
 from .setting import SETTINGS
 from zoneinfo import ZoneInfo
 from .locale import _
@@ -15,35 +18,47 @@ DB_TZ = ZoneInfo(SETTINGS["database.timezone"])
 LOCAL_TZ = ZoneInfo(get_localzone_name())
 
 
-def convert_tz(dt: datetime) -> datetime:
+# 下面几个转换函数通过默认参数把时区对象绑定为局部名，省去热路径上每次调用的全局查找
+
+def convert_tz(dt: datetime, _DB_TZ=DB_TZ) -> datetime:
     """
     Convert timezone of datetime object to DB_TZ.
     """
-    dt = dt.astimezone(DB_TZ)
+    dt = dt.astimezone(_DB_TZ)
     return dt.replace(tzinfo=None)
 
 
-def to_dbtz(t: datetime, clear_tzinfo=True) -> datetime:
+def to_dbtz(t: datetime, clear_tzinfo=True, _DB_TZ=DB_TZ, _LOCAL_TZ=LOCAL_TZ) -> datetime:
     # 从 本地时区 转换到 数据库时区
     if t.tzinfo is None:
-        t = t.replace(tzinfo=LOCAL_TZ)
-    t = t.astimezone(DB_TZ)
+        t = t.replace(tzinfo=_LOCAL_TZ)
+    t = t.astimezone(_DB_TZ)
     if clear_tzinfo:
         t = t.replace(tzinfo=None)
     return t
 
 
-def from_dbtz(t: datetime, clear_tzinfo=False) -> datetime:
+def from_dbtz(t: datetime, clear_tzinfo=False, _DB_TZ=DB_TZ, _LOCAL_TZ=LOCAL_TZ) -> datetime:
     # 从 数据库时区 转换到 本地时区
     if t.tzinfo is None:
-        t = t.replace(tzinfo=DB_TZ)
-    t = t.astimezone(LOCAL_TZ)
+        t = t.replace(tzinfo=_DB_TZ)
+    t = t.astimezone(_LOCAL_TZ)
     if clear_tzinfo:
         t = t.replace(tzinfo=None)
     return t
 
 
-@dataclass
+def convert_tz_arr(epochs_ns: np.ndarray, src_offset_s: int, dst_offset_s: int) -> np.ndarray:
+    '''
+    批量时区转换的快速路径，用于数据库适配器批量读写K线/tick时间戳。
+    epochs_ns 是 naive 的 int64 纳秒时间戳，直接做偏移加法，跳过逐行 astimezone。
+    仅适用于区间内时区偏移恒定（无夏令时切换）的情况。
+    '''
+    epochs_ns = np.asarray(epochs_ns, dtype=np.int64)
+    return np.add(epochs_ns, np.int64((dst_offset_s - src_offset_s) * 1_000_000_000))
+
+
+@dataclass(slots=True, frozen=True)
 class BarOverview:
     """
     Overview of bar data stored in database.
@@ -57,7 +72,7 @@ class BarOverview:
     end: datetime | None = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TickOverview:
     """
     Overview of tick data stored in database.
@@ -70,7 +85,7 @@ class TickOverview:
     end: datetime | None = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class DividendOverview:
     """
     Overview of dividend data stored in database.
@@ -82,7 +97,7 @@ class DividendOverview:
     end: datetime = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class TradeDateOverview:
     """
     Overview of trade date stored in database.
@@ -93,7 +108,7 @@ class TradeDateOverview:
     end: datetime = None
 
 
-@dataclass
+@dataclass(slots=True, frozen=True)
 class MainContractOverview:
     """
     Overview 主力合约
@@ -153,6 +168,94 @@ class BaseDatabase(ABC):
         """
         pass
 
+    # 下面两个是批量K线读写的列式（SoA）接口。默认实现只在边界处对 BarData 装箱/拆箱，
+    # 适配器可以重写为真正的列式读写，绕过逐行 BarData 对象
+    def save_bar_data_arrays(
+        self,
+        symbol: str,
+        exchange: Exchange,
+        interval: Interval,
+        ts: np.ndarray,
+        open_: np.ndarray,
+        high: np.ndarray,
+        low: np.ndarray,
+        close: np.ndarray,
+        volume: np.ndarray,
+        turnover: np.ndarray,
+        open_interest: np.ndarray,
+        stream: bool = False,
+    ) -> bool:
+        """
+        按列保存K线数据，ts 是 int64 纳秒时间戳（数据库时区，naive）
+        """
+        dts = np.asarray(ts, np.int64).view('datetime64[ns]').astype('datetime64[us]').tolist()
+        bars = [
+            BarData(
+                gateway_name='DB',
+                symbol=symbol,
+                exchange=exchange,
+                datetime=dt,
+                interval=interval,
+                volume=float(v),
+                turnover=float(t),
+                open_interest=float(oi),
+                open_price=float(o),
+                high_price=float(h),
+                low_price=float(lo),
+                close_price=float(c),
+            )
+            for dt, o, h, lo, c, v, t, oi in zip(dts, open_, high, low, close, volume, turnover, open_interest, strict=True)
+        ]
+        return self.save_bar_data(bars, stream)
+
+    def load_bar_data_arrays(
+        self,
+        symbol: str,
+        exchange: Exchange,
+        interval: Interval,
+        start: datetime,
+        end: datetime,
+        dividend: Dividend=Dividend.NONE,
+    ) -> dict[str, np.ndarray]:
+        """
+        按列读取K线数据，返回的 datetime 列是 int64 纳秒时间戳（数据库时区，naive）。
+        复权在列上一次顺序扫描完成，不经过逐行 BarData 调整。
+        """
+        bars = self.load_bar_data(symbol, exchange, interval, start, end, Dividend.NONE)
+        cols = {
+            'datetime': np.array([b.datetime for b in bars], dtype='datetime64[ns]').view(np.int64),
+            'open_price': np.array([b.open_price for b in bars], np.float32),
+            'high_price': np.array([b.high_price for b in bars], np.float32),
+            'low_price': np.array([b.low_price for b in bars], np.float32),
+            'close_price': np.array([b.close_price for b in bars], np.float32),
+            'volume': np.array([b.volume for b in bars], np.float64),
+            'turnover': np.array([b.turnover for b in bars], np.float64),
+            'open_interest': np.array([b.open_interest for b in bars], np.float64),
+        }
+        if dividend != Dividend.NONE and len(bars) > 0:
+            self._apply_dividend_arrays(cols, symbol, exchange, dividend)
+        return cols
+
+    def _apply_dividend_arrays(self, cols: dict[str, np.ndarray], symbol: str, exchange: Exchange, dividend: Dividend):
+        # 在列式K线数据上就地应用复权因子
+        assert dividend in (Dividend.FRONT_RATIO, Dividend.BACK_RATIO), f'暂不支持的复权类型，{dividend}'
+        # start/end 传 None 表示取全部除权记录
+        drs = self.load_dividend_data(symbol, exchange, None, None)
+        if not drs:
+            return
+        # 因子累乘和归并填充都要求除权记录按时间递增，适配器未必保证有序
+        drs = sorted(drs, key=lambda d: d.datetime)
+        div_ts = np.array([d.datetime for d in drs], dtype='datetime64[ns]').view(np.int64)
+        _, back_dr = make_front_back_dr([d.ratio for d in drs])
+        dr = make_timetags_back_dr(cols['datetime'], div_ts, back_dr)
+        if dividend == Dividend.FRONT_RATIO:
+            # 前复权因子 = 后复权因子 / 最后一个后复权因子
+            dr *= np.float32(1. / back_dr[-1])
+        cols['open_price'] *= dr
+        cols['high_price'] *= dr
+        cols['low_price'] *= dr
+        cols['close_price'] *= dr
+
     @abstractmethod
     def delete_bar_data(
         self,
@@ -216,11 +319,11 @@ class BaseDatabase(ABC):
         self,
         symbol: str,
         exchange: Exchange,
-        start: datetime,
-        end: datetime
+        start: datetime | None,
+        end: datetime | None
     ) -> list[DividendData]:
         """
-        获得除权数据
+        获得除权数据，start/end 为 None 表示不限起止时间
         """
         pass
 
@@ -338,54 +441,86 @@ class BaseDatabase(ABC):
         pass
 
     # -----------------------------------------------------------------------
+
+    # 时序类型到处理函数的映射，哈希查表代替每次调用都重建列表做线性比较
+    _HISTORY_DISPATCH = {
+        Interval.TICK: lambda self, req: self.load_tick_data(req.symbol, req.exchange, req.start, req.end, req.dividend),
+        Interval.MINUTE: lambda self, req: self.load_bar_data(req.symbol, req.exchange, req.interval, req.start, req.end, req.dividend),
+        Interval.MINUTE_5: lambda self, req: self.load_bar_data(req.symbol, req.exchange, req.interval, req.start, req.end, req.dividend),
+        Interval.HOUR: lambda self, req: self.load_bar_data(req.symbol, req.exchange, req.interval, req.start, req.end, req.dividend),
+        Interval.DAILY: lambda self, req: self.load_bar_data(req.symbol, req.exchange, req.interval, req.start, req.end, req.dividend),
+        Interval.WEEKLY: lambda self, req: self.load_bar_data(req.symbol, req.exchange, req.interval, req.start, req.end, req.dividend),
+        ExtraInterval.Dividend: lambda self, req: self.load_dividend_data(req.symbol, req.exchange, req.start, req.end),
+        ExtraInterval.TradeDate: lambda self, req: self.load_trade_date_data(req.exchange, req.start, req.end),
+    }
+
+    _OVERVIEW_DISPATCH = {
+        Interval.TICK: lambda self, symbol, exchange, interval: self.get_tick_overview(symbol, exchange),
+        Interval.MINUTE: lambda self, symbol, exchange, interval: self.get_bar_overview(symbol, exchange, interval),
+        Interval.MINUTE_5: lambda self, symbol, exchange, interval: self.get_bar_overview(symbol, exchange, interval),
+        Interval.HOUR: lambda self, symbol, exchange, interval: self.get_bar_overview(symbol, exchange, interval),
+        Interval.DAILY: lambda self, symbol, exchange, interval: self.get_bar_overview(symbol, exchange, interval),
+        Interval.WEEKLY: lambda self, symbol, exchange, interval: self.get_bar_overview(symbol, exchange, interval),
+        ExtraInterval.Dividend: lambda self, symbol, exchange, interval: self.get_dividend_overview(symbol, exchange),
+        ExtraInterval.TradeDate: lambda self, symbol, exchange, interval: self.get_trade_date_overview(exchange),
+    }
+
     def query_history_uni(self, req: HistoryRequest):
-        if req.interval == Interval.TICK:
-            return self.load_tick_data(req.symbol, req.exchange, req.start, req.end, req.dividend)
-        elif req.interval in [Interval.MINUTE, Interval.MINUTE_5, Interval.HOUR, Interval.DAILY, Interval.WEEKLY]:
-            return self.load_bar_data(req.symbol, req.exchange, req.interval, req.start, req.end, req.dividend)
-        elif req.interval == ExtraInterval.Dividend:
-            return self.load_dividend_data(req.symbol, req.exchange, req.start, req.end)
-        elif req.interval == ExtraInterval.TradeDate:
-            return self.load_trade_date_data(req.exchange, req.start, req.end)
-        else:
-            raise AssertionError(f'query_history_uni 不支持请求的类型，{req.interval}')
+        try:
+            handler = self._HISTORY_DISPATCH[req.interval]
+        except KeyError:
+            raise AssertionError(f'query_history_uni 不支持请求的类型，{req.interval}') from None
+        return handler(self, req)
 
     def query_overview_uni(self, symbol: str, exchange: Exchange, interval: Interval|ExtraInterval):
-        if interval == Interval.TICK:
-            return self.get_tick_overview(symbol, exchange)
-        elif interval in [Interval.MINUTE, Interval.MINUTE_5, Interval.HOUR, Interval.DAILY, Interval.WEEKLY]:
-            return self.get_bar_overview(symbol, exchange, interval)
-        elif interval == ExtraInterval.Dividend:
-            return self.get_dividend_overview(symbol, exchange)
-        elif interval == ExtraInterval.TradeDate:
-            return self.get_trade_date_overview(exchange)
-        else:
-            raise AssertionError(f'query_overview_uni 不支持请求的类型，{interval}')
+        try:
+            handler = self._OVERVIEW_DISPATCH[interval]
+        except KeyError:
+            raise AssertionError(f'query_overview_uni 不支持请求的类型，{interval}') from None
+        return handler(self, symbol, exchange, interval)
+
+    def get_overview_end(self, symbol: str, exchange: Exchange, interval: Interval|ExtraInterval) -> datetime | None:
+        '''
+        获取指定数据在库中的最新时间点，无数据时返回None。
+        默认实现退回到完整的 overview 查询；适配器可重写为
+        SELECT MAX(datetime) ... 这样的单条SQL快速路径
+        '''
+        ows = self.query_overview_uni(symbol, exchange, interval)
+        if len(ows) == 0:
+            return None
+        assert len(ows) == 1
+        return ows[0].end
 
     # -----------------------------------------------------------------------
 
 
 database: BaseDatabase | None = None
+_db_lock = threading.Lock()
 
 
 def get_database() -> BaseDatabase:
     """"""
     # Return database object if already inited
     global database
-    if database:
+    if database is not None:
         return database
 
-    # Read database related global setting
-    database_name: str = SETTINGS["database.name"]
-    module_name: str = f"vnpy_{database_name}"
-
-    # Try to import database module
-    try:
-        module: ModuleType = import_module(module_name)
-    except ModuleNotFoundError:
-        print(_("找不到数据库驱动{}，使用默认的SQLite数据库").format(module_name))
-        module = import_module("vnpy_sqlite")
-
-    # Create database object from module
-    database = module.Database()
-    return database     # type: ignore
+    # 双重检查加锁，避免多线程首次调用时重复初始化出两个连接池
+    with _db_lock:
+        if database is not None:
+            return database
+
+        # Read database related global setting
+        database_name: str = SETTINGS["database.name"]
+        module_name: str = f"vnpy_{database_name}"
+
+        # Try to import database module
+        try:
+            module: ModuleType = import_module(module_name)
+        except ModuleNotFoundError:
+            print(_("找不到数据库驱动{}，使用默认的SQLite数据库").format(module_name))
+            module = import_module("vnpy_sqlite")
+
+        # Create database object from module
+        database = module.Database()
+        return database     # type: ignore
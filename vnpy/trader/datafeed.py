@@ -1,3 +1,4 @@
+import threading
 from types import ModuleType
 from collections.abc import Callable
 from importlib import import_module
@@ -47,17 +48,24 @@ class BaseDatafeed:
         output(_("查询交易日数据失败：没有正确配置数据服务"))
         return []
 
+    # 时序类型到查询方法名的映射，哈希查表代替每次调用都重建列表做线性比较
+    _HISTORY_DISPATCH = {
+        Interval.TICK: 'query_tick_history',
+        Interval.MINUTE: 'query_bar_history',
+        Interval.MINUTE_5: 'query_bar_history',
+        Interval.HOUR: 'query_bar_history',
+        Interval.DAILY: 'query_bar_history',
+        Interval.WEEKLY: 'query_bar_history',
+        ExtraInterval.Dividend: 'query_dividend_history',
+        ExtraInterval.TradeDate: 'query_tradedate_history',
+    }
+
     def query_history_uni(self, req: HistoryRequest, output: Callable = print):
-        if req.interval == Interval.TICK:
-            return self.query_tick_history(req, output)
-        elif req.interval in [Interval.MINUTE, Interval.MINUTE_5, Interval.HOUR, Interval.DAILY, Interval.WEEKLY]:
-            return self.query_bar_history(req, output)
-        elif req.interval == ExtraInterval.Dividend:
-            return self.query_dividend_history(req, output)
-        elif req.interval == ExtraInterval.TradeDate:
-            return self.query_tradedate_history(req, output)
-        else:
-            raise AssertionError(f'query_history_uni 不支持请求的类型，{req.interval}')
+        try:
+            meth = getattr(self, self._HISTORY_DISPATCH[req.interval])
+        except KeyError:
+            raise AssertionError(f'query_history_uni 不支持请求的类型，{req.interval}') from None
+        return meth(req, output)
 
     def close(self):
         '''
@@ -68,35 +76,41 @@ class BaseDatafeed:
 
 
 datafeed: BaseDatafeed | None = None
+_df_lock = threading.Lock()
 
 
 def get_datafeed() -> BaseDatafeed:
     """"""
     # Return datafeed object if already inited
     global datafeed
-    if datafeed:
+    if datafeed is not None:
         return datafeed
 
-    # Read datafeed related global setting
-    datafeed_name: str = SETTINGS["datafeed.name"]
+    # 双重检查加锁，避免多线程首次调用时重复初始化
+    with _df_lock:
+        if datafeed is not None:
+            return datafeed
+
+        # Read datafeed related global setting
+        datafeed_name: str = SETTINGS["datafeed.name"]
 
-    if not datafeed_name:
-        datafeed = BaseDatafeed()
+        if not datafeed_name:
+            datafeed = BaseDatafeed()
 
-        print(_("没有配置要使用的数据服务，请修改全局配置中的datafeed相关内容"))
-    else:
-        module_name: str = f"vnpy_{datafeed_name}"
+            print(_("没有配置要使用的数据服务，请修改全局配置中的datafeed相关内容"))
+        else:
+            module_name: str = f"vnpy_{datafeed_name}"
 
-        # Try to import datafeed module
-        try:
-            module: ModuleType = import_module(module_name)
+            # Try to import datafeed module
+            try:
+                module: ModuleType = import_module(module_name)
 
-            # Create datafeed object from module
-            datafeed = module.Datafeed()
-        # Use base class if failed
-        except ModuleNotFoundError:
-            datafeed = BaseDatafeed()
+                # Create datafeed object from module
+                datafeed = module.Datafeed()
+            # Use base class if failed
+            except ModuleNotFoundError:
+                datafeed = BaseDatafeed()
 
-            print(_("无法加载数据服务模块，请运行 pip install {} 尝试安装").format(module_name))
+                print(_("无法加载数据服务模块，请运行 pip install {} 尝试安装").format(module_name))
 
-    return datafeed     # type: ignore
+        return datafeed     # type: ignore
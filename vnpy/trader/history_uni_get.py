@@ -1,3 +1,4 @@
+import sys
 from .constant import Interval, ExtraInterval, Exchange
 from .object import HistoryRequest
 from datetime import datetime, timedelta
@@ -7,16 +8,68 @@ from .database import BaseDatabase, get_database
 from functools import lru_cache
 
 
-@lru_cache(None, typed=True)
+# cut 的字符串常量统一驻留，比较时只需指针相等判断
+_AUTO = sys.intern('auto')
+_DB = sys.intern('database')
+_DF = sys.intern('datafeed')
+
+
+# 缓存已解析的数据库/数据服务实例，热路径上只需一次下标读取
+_db_ref: list[BaseDatabase | None] = [None]
+_df_ref: list[BaseDatafeed | None] = [None]
+
+
+def prime():
+    # 可在引擎启动时调用，预先解析数据库和数据服务实例
+    _db_ref[0] = get_database()
+    _df_ref[0] = get_datafeed()
+
+
+@lru_cache(maxsize=4096, typed=True)
 def _auto_cache(symbol: str, exchange: Exchange, interval: Interval|ExtraInterval) -> datetime|None:
     database: BaseDatabase = get_database()
-    ows = database.query_overview_uni(symbol, exchange, interval)
-    if len(ows) == 0:
+    end = database.get_overview_end(symbol, exchange, interval)
+    if end is None:
         return None
     else:
-        assert len(ows) == 1
-        ow = ows[0]
-        return ow.end - timedelta(days=1)
+        return end - timedelta(days=1)
+
+
+def invalidate_overview_cache():
+    # 数据库写入新数据后调用，使 cut='auto' 的缓存失效
+    _auto_cache.cache_clear()
+
+
+def _split_by_datetime(cut: datetime, req: HistoryRequest) -> tuple[datetime|None, datetime|None, datetime|None]:
+    # 以给定时间点切分请求区间，返回 (start_dt, mid_dt, end_dt)
+    start_dt = req.start
+    mid_dt = cut
+    end_dt = req.end
+    assert start_dt <= mid_dt <= end_dt, 'mid_dt 必须在start_dt和end_dt之间'
+    if mid_dt == start_dt:
+        start_dt = None
+    elif mid_dt == end_dt:
+        end_dt = None
+    return start_dt, mid_dt, end_dt
+
+
+def _resolve_str_cut(cut: str, req: HistoryRequest) -> tuple[datetime|None, datetime|None, datetime|None]:
+    # 解析字符串形式的 cut（调用方已驻留），直接返回 (start_dt, mid_dt, end_dt)
+    if cut is _AUTO:
+        # 从数据库里面寻找最近的数据，然后再筛选
+        r = _auto_cache(req.symbol, req.exchange, req.interval)
+        if r is None:
+            cut = _DF
+        else:
+            assert isinstance(r, datetime)
+            return _split_by_datetime(r, req)
+
+    if cut is _DB:
+        return req.start, req.end, None
+    elif cut is _DF:
+        return None, req.start, req.end
+    else:
+        raise AssertionError('不支持 cut 类型', str(cut))
 
 
 def query_history_uni(
@@ -31,8 +84,12 @@ def query_history_uni(
     注意，分割时点后，都是用 datafeed 的，分割时点前，都是用 database 的，这里会认为 datafeed的数据会比database的更新
     """
 
-    datafeed: BaseDatafeed = get_datafeed()
-    database: BaseDatabase = get_database()
+    datafeed: BaseDatafeed = _df_ref[0]
+    if datafeed is None:
+        datafeed = _df_ref[0] = get_datafeed()
+    database: BaseDatabase = _db_ref[0]
+    if database is None:
+        database = _db_ref[0] = get_database()
 
     '''
     start_dt    database的起始时间点
@@ -40,24 +97,9 @@ def query_history_uni(
     end_dt      datafeed的结束时间点
     '''
 
-    if cut == 'auto':
-        # 从数据库里面寻找最近的数据，然后再筛选
-        r = _auto_cache(req.interval, req.symbol, req.exchange)
-        if r is None:
-            cut = 'datafeed'
-        else:
-            assert isinstance(r, datetime)
-            cut = r
-
-    if cut == 'database':
-        start_dt = req.start
-        mid_dt = req.end
-        end_dt = None
-
-    elif cut == 'datafeed':
-        start_dt = None
-        mid_dt = req.start
-        end_dt = req.end
+    if isinstance(cut, str):
+        # 驻留后外部传入的新建字符串同样走指针相等的快速路径
+        start_dt, mid_dt, end_dt = _resolve_str_cut(sys.intern(cut), req)
 
     elif isinstance(cut, timedelta):
         start_dt = req.start
@@ -71,14 +113,7 @@ def query_history_uni(
             mid_dt = end_dt
 
     elif isinstance(cut, datetime):
-        start_dt = req.start
-        mid_dt = cut
-        end_dt = req.end
-        assert start_dt <= mid_dt <= end_dt, 'mid_dt 必须在start_dt和end_dt之间'
-        if mid_dt == start_dt:
-            start_dt = None
-        elif mid_dt == end_dt:
-            end_dt = None
+        start_dt, mid_dt, end_dt = _split_by_datetime(cut, req)
 
     else:
         raise AssertionError('不支持 cut 类型', str(cut))